@@ -4,7 +4,7 @@ __version__ = "0.1.0"
 __author__ = "artesk"
 
 from .mcp_server import OneCMcpServer
-from .api_client import OneCApiClient
+from .api_client import OneCApiClient, close_shared_clients
 from .config import Config
 
-__all__ = ["OneCMcpServer", "OneCApiClient", "Config"] 
\ No newline at end of file
+__all__ = ["OneCMcpServer", "OneCApiClient", "Config", "close_shared_clients"] 
\ No newline at end of file
@@ -1,24 +1,122 @@
 """HTTP клиент для работы с API 1С.ai."""
 
 import asyncio
-import json
 import logging
-from typing import Optional, AsyncGenerator, Dict
-from datetime import datetime, timedelta
+import re
+import time
+from collections import OrderedDict
+from typing import Optional, AsyncGenerator, Dict, List, Tuple, Union
 
 import httpx
+
+# orjson заметно быстрее на горячем пути SSE, но остается опциональным
+try:
+    import orjson as _json
+    _dumps = _json.dumps
+except ImportError:
+    import json as _json
+
+    def _dumps(obj) -> bytes:
+        return _json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
 from .config import Config
 from .models import (
     ConversationRequest, 
-    ConversationResponse, 
-    MessageRequest,
-    MessageChunk,
     ConversationSession,
     ApiError
 )
 
 logger = logging.getLogger(__name__)
 
+# Префикс строки данных в SSE потоке
+_DATA_PREFIX = b"data: "
+_DATA_PREFIX_LEN = len(_DATA_PREFIX)
+_DATA_FIRST_BYTE = _DATA_PREFIX[0]
+
+# Разделители строк в SSE потоке
+_LINE_END = re.compile(rb"\r\n|\r|\n")
+
+
+def _loads_sse_payload(payload: bytearray):
+    """Разобрать JSON из строки SSE, заменяя битые байты UTF-8, как делал aiter_lines()."""
+    try:
+        return _json.loads(payload)
+    except ValueError:
+        # JSONDecodeError обеих библиотек и UnicodeDecodeError stdlib - подклассы ValueError
+        return _json.loads(payload.decode('utf-8', errors='replace'))
+
+
+# Общие HTTP клиенты по ключу (base_url, токен, таймаут) и число их владельцев
+_CLIENT_CACHE: Dict[Tuple[str, str, int], httpx.AsyncClient] = {}
+_CLIENT_REFS: Dict[Tuple[str, str, int], int] = {}
+
+
+def _client_key(config: Config) -> Tuple[str, str, int]:
+    """Ключ общего HTTP клиента для конфигурации."""
+    return (config.base_url, config.onec_ai_token, config.timeout)
+
+
+def _acquire_shared_client(config: Config) -> httpx.AsyncClient:
+    """Получить общий HTTP клиент для конфигурации и увеличить число его владельцев."""
+    key = _client_key(config)
+    client = _CLIENT_CACHE.get(key)
+    if client is None or client.is_closed:
+        client = _CLIENT_CACHE[key] = _create_http_client(config)
+        _CLIENT_REFS[key] = 0
+    
+    _CLIENT_REFS[key] += 1
+    return client
+
+
+async def _release_shared_client(config: Config, client: httpx.AsyncClient):
+    """Освободить общий HTTP клиент, закрыв его вместе с последним владельцем."""
+    key = _client_key(config)
+    if _CLIENT_CACHE.get(key) is not client:
+        # Клиент уже закрыт через close_shared_clients() или заменен новым
+        return
+    
+    _CLIENT_REFS[key] -= 1
+    if _CLIENT_REFS[key] <= 0:
+        del _CLIENT_CACHE[key]
+        del _CLIENT_REFS[key]
+        await client.aclose()
+
+
+def _create_http_client(config: Config) -> httpx.AsyncClient:
+    """Создать HTTP клиент для API 1С.ai."""
+    # HTTP/2 позволяет параллельным вызовам инструментов делить одно TLS соединение,
+    # а пул сохраняет его между запросами. Свой транспорт не передаем, чтобы httpx
+    # продолжал учитывать прокси из переменных окружения
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=32,
+            max_keepalive_connections=16,
+            keepalive_expiry=60.0
+        ),
+        timeout=config.timeout,
+        headers={
+            "Accept": "*/*",
+            "Accept-Charset": "utf-8",
+            "Accept-Encoding": "gzip, deflate, br",
+            "Accept-Language": "ru-ru,en-us;q=0.8,en;q=0.7",
+            "Authorization": config.onec_ai_token,
+            "Content-Type": "application/json; charset=utf-8",
+            "Origin": config.base_url,
+            "Referer": f"{config.base_url}/chat/",
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/620.1 (KHTML, like Gecko) JavaFX/22 Safari/620.1",
+        }
+    )
+
+
+async def close_shared_clients():
+    """Принудительно закрыть все общие HTTP клиенты, независимо от числа владельцев."""
+    clients = list(_CLIENT_CACHE.values())
+    _CLIENT_CACHE.clear()
+    _CLIENT_REFS.clear()
+    for client in clients:
+        await client.aclose()
+
 
 class OneCApiClient:
     """Клиент для работы с API 1С.ai."""
@@ -26,23 +124,37 @@ class OneCApiClient:
     def __init__(self, config: Config):
         self.config = config
         self.base_url = config.base_url.rstrip('/')
-        self.sessions: Dict[str, ConversationSession] = {}
-        
-        # Создаем HTTP клиент
-        self.client = httpx.AsyncClient(
-            timeout=config.timeout,
-            headers={
-                "Accept": "*/*",
-                "Accept-Charset": "utf-8",
-                "Accept-Encoding": "gzip, deflate, br",
-                "Accept-Language": "ru-ru,en-us;q=0.8,en;q=0.7",
-                "Authorization": config.onec_ai_token,
-                "Content-Type": "application/json; charset=utf-8",
-                "Origin": config.base_url,
-                "Referer": f"{config.base_url}/chat/",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/620.1 (KHTML, like Gecko) JavaFX/22 Safari/620.1",
-            }
+        # Сессии упорядочены по времени последнего использования (LRU): в начале самые старые
+        self.sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        
+        # HTTP клиент общий для всех открытых экземпляров с той же конфигурацией
+        # и закрывается вместе с последним из них
+        self.client = _acquire_shared_client(config)
+        self._client_released = False
+        
+        # URL эндпоинта дискуссий разбирается один раз, для сообщений храним готовый префикс
+        self._conversations_prefix = f"{self.base_url}/chat_api/v1/conversations/"
+        self._conversations_url = httpx.URL(self._conversations_prefix)
+        
+        # Дополнительные заголовки запросов не меняются, собираем их заранее
+        self._create_conv_headers = httpx.Headers({"Session-Id": ""})
+        self._stream_headers = httpx.Headers({"Accept": "text/event-stream"})
+        
+        # Тело запроса создания дискуссии с настройками по умолчанию не меняется
+        self._default_conversation_body = self._build_conversation_body()
+    
+    def _build_conversation_body(
+        self, 
+        programming_language: Optional[str] = None,
+        script_language: Optional[str] = None
+    ) -> bytes:
+        """Сериализованное тело запроса на создание дискуссии."""
+        request_data = ConversationRequest(
+            ui_language=self.config.ui_language,
+            programming_language=programming_language or self.config.programming_language,
+            script_language=script_language or self.config.script_language
         )
+        return _dumps(request_data.dict())
     
     async def create_conversation(
         self, 
@@ -51,16 +163,15 @@ class OneCApiClient:
     ) -> str:
         """Создать новую дискуссию."""
         try:
-            request_data = ConversationRequest(
-                ui_language=self.config.ui_language,
-                programming_language=programming_language or self.config.programming_language,
-                script_language=script_language or self.config.script_language
-            )
+            if programming_language or script_language:
+                body = self._build_conversation_body(programming_language, script_language)
+            else:
+                body = self._default_conversation_body
             
             response = await self.client.post(
-                f"{self.base_url}/chat_api/v1/conversations/",
-                json=request_data.dict(),
-                headers={"Session-Id": ""}
+                self._conversations_url,
+                content=body,
+                headers=self._create_conv_headers
             )
             
             if response.status_code != 200:
@@ -69,15 +180,15 @@ class OneCApiClient:
                     response.status_code
                 )
             
-            conversation_response = ConversationResponse(**response.json())
-            conversation_id = conversation_response.uuid
+            # Из ответа (формат ConversationResponse) нужен только uuid
+            conversation_id = _json.loads(response.content)["uuid"]
             
             # Сохраняем сессию
             self.sessions[conversation_id] = ConversationSession(
                 conversation_id=conversation_id
             )
             
-            logger.info(f"Создана новая дискуссия: {conversation_id}")
+            logger.info("Создана новая дискуссия: %s", conversation_id)
             return conversation_id
             
         except httpx.RequestError as e:
@@ -86,7 +197,11 @@ class OneCApiClient:
             raise ApiError(f"Неожиданная ошибка при создании дискуссии: {str(e)}")
     
     async def send_message(self, conversation_id: str, message: str) -> str:
-        """Отправить сообщение в дискуссию и получить ответ."""
+        """Отправить сообщение в дискуссию и получить ответ.
+        
+        Параллельные вызовы для одной дискуссии не упорядочиваются между собой,
+        для упорядоченной отправки используйте send_messages().
+        """
         try:
             # Проверяем существование сессии
             if conversation_id not in self.sessions:
@@ -96,17 +211,19 @@ class OneCApiClient:
             
             # Обновляем использование сессии
             self.sessions[conversation_id].update_usage()
+            self.sessions.move_to_end(conversation_id)
             
-            request_data = MessageRequest(instruction=message)
+            # Формат совпадает с MessageRequest, но без построения pydantic модели
+            body = _dumps({"parent_uuid": None, "tool_content": {"instruction": message}})
             
             # Отправляем сообщение
-            url = f"{self.base_url}/chat_api/v1/conversations/{conversation_id}/messages"
+            url = f"{self._conversations_prefix}{conversation_id}/messages"
             
             async with self.client.stream(
                 "POST",
                 url,
-                json=request_data.dict(),
-                headers={"Accept": "text/event-stream"}
+                content=body,
+                headers=self._stream_headers
             ) as response:
                 
                 if response.status_code != 200:
@@ -118,52 +235,112 @@ class OneCApiClient:
                 # Собираем ответ из SSE потока
                 full_response = await self._parse_sse_response(response)
                 
-                logger.info(f"Получен ответ для дискуссии {conversation_id}")
+                logger.info("Получен ответ для дискуссии %s", conversation_id)
                 return full_response
-                
+            
         except httpx.RequestError as e:
             raise ApiError(f"Ошибка сети при отправке сообщения: {str(e)}")
         except Exception as e:
             raise ApiError(f"Неожиданная ошибка при отправке сообщения: {str(e)}")
     
+    async def send_messages(
+        self, 
+        pairs: List[Tuple[str, str]]
+    ) -> List[Union[str, ApiError]]:
+        """Отправить несколько сообщений, по возможности параллельно.
+        
+        Принимает пары (conversation_id, message) и возвращает ответы в том же порядке.
+        Разные дискуссии обрабатываются параллельно, а сообщения одной дискуссии
+        отправляются по очереди в заданном порядке, т.к. ответ зависит от предыдущих
+        сообщений. Ошибка одного сообщения не прерывает остальные: на его месте
+        в результате будет ApiError.
+        """
+        results: List[Union[str, ApiError]] = [None] * len(pairs)
+        
+        # Индексы сообщений по дискуссиям с сохранением порядка
+        by_conversation: Dict[str, List[int]] = {}
+        for index, (conversation_id, _) in enumerate(pairs):
+            by_conversation.setdefault(conversation_id, []).append(index)
+        
+        async def send_in_order(indexes: List[int]):
+            for index in indexes:
+                conversation_id, message = pairs[index]
+                try:
+                    results[index] = await self.send_message(conversation_id, message)
+                except ApiError as e:
+                    results[index] = e
+        
+        await asyncio.gather(*(send_in_order(indexes) for indexes in by_conversation.values()))
+        return results
+    
     async def _parse_sse_response(self, response: httpx.Response) -> str:
         """Парсинг Server-Sent Events ответа."""
         full_text = ""
         
-        # Убеждаемся что кодировка UTF-8
-        response.encoding = 'utf-8'
-        
-        async for line in response.aiter_lines():
-            if line.startswith("data: "):
-                try:
-                    data_str = line[6:]  # Убираем "data: "
-                    data = json.loads(data_str)
+        async for line in self._iter_sse_lines(response):
+            # Пустые строки, комментарии-keepalive (":") и прочие поля SSE отсекаем
+            # по первому байту, не доходя до сравнения префикса
+            if len(line) <= _DATA_PREFIX_LEN or line[0] != _DATA_FIRST_BYTE:
+                continue
+            if not line.startswith(_DATA_PREFIX):
+                continue
+            
+            try:
+                data = _loads_sse_payload(line[_DATA_PREFIX_LEN:])  # Убираем "data: "
+                
+                # Поля MessageChunk читаем напрямую из словаря, без валидации на каждый чанк
+                content = data.get("content")
+                
+                # Если это ответ ассистента с контентом
+                if (data.get("role") == "assistant" and 
+                    content and 
+                    "text" in content):
                     
-                    chunk = MessageChunk(**data)
+                    text = content["text"]
+                    if text:
+                        full_text = text  # Берем полный текст из последнего чанка
                     
-                    # Если это ответ ассистента с контентом
-                    if (chunk.role == "assistant" and 
-                        chunk.content and 
-                        "text" in chunk.content):
+                    # Если сообщение завершено
+                    if data.get("finished"):
+                        break
                         
-                        text = chunk.content["text"]
-                        if text:
-                            # Нормализуем текст для безопасности
-                            text = text.encode('utf-8', errors='ignore').decode('utf-8', errors='ignore')
-                            full_text = text  # Берем полный текст из последнего чанка
-                        
-                        # Если сообщение завершено
-                        if chunk.finished:
-                            break
-                            
-                except json.JSONDecodeError:
-                    continue
-                except Exception as e:
-                    logger.warning(f"Ошибка парсинга SSE chunk: {e}")
-                    continue
+            except _json.JSONDecodeError:
+                continue
+            except Exception as e:
+                # Битые чанки в потоке ожидаемы, поэтому только на уровне DEBUG
+                logger.debug("Ошибка парсинга SSE chunk: %s", e)
+                continue
         
         return full_text.strip()
     
+    @staticmethod
+    async def _iter_sse_lines(response: httpx.Response) -> AsyncGenerator[bytearray, None]:
+        """Построчное чтение SSE потока без декодирования в str.
+        
+        Строки разделяются по \r\n, \r или \n, как в httpx.aiter_lines().
+        """
+        buffer = bytearray()
+        
+        async for chunk in response.aiter_bytes():
+            buffer += chunk
+            if b"\n" not in chunk and b"\r" not in chunk:
+                continue
+            
+            start = 0
+            for match in _LINE_END.finditer(buffer):
+                # \r в конце буфера может оказаться началом \r\n из следующего чанка
+                if match.end() == len(buffer) and match.group() == b"\r":
+                    break
+                yield buffer[start:match.start()]
+                start = match.end()
+            del buffer[:start]  # Незавершенный хвост ждет следующего чанка
+        
+        # Последняя строка может прийти без завершающего перевода строки
+        if buffer.endswith(b"\r"):
+            yield buffer[:-1]
+        elif buffer:
+            yield buffer
+    
     async def get_or_create_session(
         self, 
         create_new: bool = False,
@@ -178,41 +355,53 @@ class OneCApiClient:
         if create_new or not self.sessions:
             return await self.create_conversation(programming_language)
         
+        # Самая свежая сессия будет возвращена, ее не вытесняем
+        recent_session_id = next(reversed(self.sessions))
+        
         # Проверяем лимит активных сессий
-        if len(self.sessions) >= self.config.max_active_sessions:
-            # Удаляем самую старую сессию
+        if len(self.sessions) >= self.config.max_active_sessions and len(self.sessions) > 1:
+            # Удаляем сессию с наименьшей ценностью по LRU-K,
+            # чтобы всплеск разовых сессий не вытеснял постоянные дискуссии
             oldest_session_id = min(
-                self.sessions.keys(), 
-                key=lambda k: self.sessions[k].last_used
-            )
+                (
+                    session for session_id, session in self.sessions.items()
+                    if session_id != recent_session_id
+                ),
+                key=ConversationSession.eviction_key
+            ).conversation_id
             del self.sessions[oldest_session_id]
-            logger.info(f"Удалена старая сессия: {oldest_session_id}")
-        
-        # Возвращаем самую свежую сессию
-        recent_session_id = max(
-            self.sessions.keys(), 
-            key=lambda k: self.sessions[k].last_used
-        )
+            logger.info("Удалена старая сессия: %s", oldest_session_id)
         
         return recent_session_id
     
     async def _cleanup_old_sessions(self):
         """Очистка устаревших сессий."""
-        current_time = datetime.now()
-        ttl_delta = timedelta(seconds=self.config.session_ttl)
+        current_time = time.monotonic()
+        ttl = self.config.session_ttl
         
-        expired_sessions = [
-            session_id for session_id, session in self.sessions.items()
-            if current_time - session.last_used > ttl_delta
-        ]
-        
-        for session_id in expired_sessions:
-            del self.sessions[session_id]
-            logger.info(f"Удалена устаревшая сессия: {session_id}")
+        # Сессии упорядочены по last_used, поэтому устаревшие лежат в начале
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if current_time - session.last_used <= ttl:
+                break
+            
+            self.sessions.popitem(last=False)
+            logger.info("Удалена устаревшая сессия: %s", session_id)
+    
+    async def warmup(self):
+        """Заранее установить соединение с API (TLS и HTTP/2), любые ошибки игнорируются."""
+        try:
+            await self.client.head(self.base_url, timeout=5.0)
+        except Exception as e:
+            # Прогрев необязателен: ошибки (в том числе неверный URL) проявятся при первом запросе
+            logger.debug("Не удалось прогреть соединение: %s", e)
     
     async def close(self):
-        """Закрыть HTTP клиент."""
-        await self.client.aclose()
+        """Освободить общий HTTP клиент (закрывается, когда его больше никто не использует)."""
+        if self._client_released:
+            return
+        self._client_released = True
+        await _release_shared_client(self.config, self.client)
         
     async def __aenter__(self):
         return self
@@ -2,55 +2,70 @@
 
 import asyncio
 import logging
-from typing import Any, Sequence, Optional
+import unicodedata
+from typing import Optional
 
 from mcp.server.models import InitializationOptions
 from mcp.server import NotificationOptions, Server
-from mcp.types import (
-    Resource, 
-    Tool, 
-    TextContent, 
-    ImageContent, 
-    EmbeddedResource,
-    LoggingLevel
-)
-import mcp.types as types
+from mcp.types import Tool, TextContent
 
 from .config import get_config, Config
 from .api_client import OneCApiClient
-from .models import ApiError, McpToolRequest, McpToolResponse
+from .models import ApiError
 
 # Настройка логирования только для ошибок при работе с MCP
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.ERROR)
 
+# Управляющие символы (категории Cc и Cf по Unicode 14.0) кроме \t, \n и \r,
+# заданные диапазонами, чтобы не сканировать все кодовые точки при импорте
+_CTRL_RANGES = (
+    (0x0000, 0x0008), (0x000B, 0x000C), (0x000E, 0x001F), (0x007F, 0x009F),
+    (0x00AD, 0x00AD), (0x0600, 0x0605), (0x061C, 0x061C), (0x06DD, 0x06DD),
+    (0x070F, 0x070F), (0x0890, 0x0891), (0x08E2, 0x08E2), (0x180E, 0x180E),
+    (0x200B, 0x200F), (0x202A, 0x202E), (0x2060, 0x2064), (0x2066, 0x206F),
+    (0xFEFF, 0xFEFF), (0xFFF9, 0xFFFB), (0x110BD, 0x110BD), (0x110CD, 0x110CD),
+    (0x13430, 0x13438), (0x1BCA0, 0x1BCA3), (0x1D173, 0x1D17A), (0xE0001, 0xE0001),
+    (0xE0020, 0xE007F),
+)
+
+# Таблица для str.translate
+_CTRL_TABLE = dict.fromkeys(
+    cp for start, end in _CTRL_RANGES for cp in range(start, end + 1)
+)
+
 
 class OneCMcpServer:
     """MCP сервер для интеграции с 1С.ai."""
     
+    # Шаблоны вопросов к модели
+    _EXPLAIN_TMPL = "Объясни синтаксис и использование: {syntax_element}"
+    _EXPLAIN_CONTEXT_TMPL = "Объясни синтаксис и использование: {syntax_element} в контексте: {context}"
+    _CHECK_TMPL = "Проверь этот код 1С на {desc} и дай рекомендации:\n\n```1c\n{code}\n```"
+    
+    # Описания типов проверки кода
+    _CHECK_DESC = {
+        "syntax": "синтаксические ошибки",
+        "logic": "логические ошибки и потенциальные проблемы",
+        "performance": "проблемы производительности и оптимизации"
+    }
+    
     @staticmethod
     def _sanitize_text(text: str) -> str:
         """Очистка текста от проблемных символов для корректного отображения."""
         if not text:
             return text
         
-        # Удаляем или заменяем проблемные Unicode символы
-        import unicodedata
-        
         # Нормализуем Unicode
         text = unicodedata.normalize('NFKC', text)
         
         # Удаляем управляющие символы кроме стандартных переносов строк
-        cleaned = ''
-        for char in text:
-            if unicodedata.category(char) not in ['Cc', 'Cf'] or char in ['\n', '\r', '\t']:
-                cleaned += char
-            
-        return cleaned
+        return text.translate(_CTRL_TABLE)
     
     def __init__(self, config: Optional[Config] = None):
         self.config = config
         self.api_client: Optional[OneCApiClient] = None
+        self._warmup_task: Optional[asyncio.Task] = None
         
         # Создаем MCP сервер  
         self.server = Server("onec-ai-1c-enterprise")
@@ -132,7 +147,7 @@ class OneCMcpServer:
             ]
         
         @self.server.call_tool()
-        async def handle_call_tool(name: str, arguments: dict) -> list[types.TextContent]:
+        async def handle_call_tool(name: str, arguments: dict) -> list[TextContent]:
             """Обработка вызова инструментов."""
             
             # Отладочное логирование (без эмодзи для избежания проблем с кодировкой)
@@ -143,7 +158,7 @@ class OneCMcpServer:
                 try:
                     self.config = get_config()
                 except Exception as e:
-                    return [types.TextContent(
+                    return [TextContent(
                         type="text",
                         text=f"Ошибка конфигурации: {str(e)}\nУстановите переменную окружения ONEC_AI_TOKEN"
                     )]
@@ -152,7 +167,7 @@ class OneCMcpServer:
                 try:
                     self.api_client = OneCApiClient(self.config)
                 except Exception as e:
-                    return [types.TextContent(
+                    return [TextContent(
                         type="text",
                         text=f"Ошибка подключения к API: {str(e)}"
                     )]
@@ -165,32 +180,32 @@ class OneCMcpServer:
                 elif name == "check_1c_code":
                     return await self._handle_check_code(arguments)
                 else:
-                    return [types.TextContent(
+                    return [TextContent(
                         type="text",
                         text=f"Неизвестный инструмент: {name}"
                     )]
                     
             except ApiError as e:
-                logger.error(f"Ошибка API при вызове {name}: {e.message}")
-                return [types.TextContent(
+                logger.error("Ошибка API при вызове %s: %s", name, e.message)
+                return [TextContent(
                     type="text",
                     text=f"Ошибка при обращении к 1С.ai: {e.message}"
                 )]
             except Exception as e:
-                logger.error(f"Неожиданная ошибка при вызове {name}: {str(e)}")
-                return [types.TextContent(
+                logger.error("Неожиданная ошибка при вызове %s: %s", name, e)
+                return [TextContent(
                     type="text",
                     text=f"Произошла неожиданная ошибка: {str(e)}"
                 )]
     
-    async def _handle_ask_1c_ai(self, arguments: dict) -> list[types.TextContent]:
+    async def _handle_ask_1c_ai(self, arguments: dict) -> list[TextContent]:
         """Обработка инструмента ask_1c_ai."""
         question = arguments.get("question", "")
         programming_language = arguments.get("programming_language", "")
         create_new_session = arguments.get("create_new_session", False)
         
         if not question.strip():
-            return [types.TextContent(
+            return [TextContent(
                 type="text",
                 text="Ошибка: Вопрос не может быть пустым"
             )]
@@ -207,26 +222,27 @@ class OneCMcpServer:
         # Очищаем ответ от проблемных символов
         clean_answer = self._sanitize_text(answer)
         
-        return [types.TextContent(
+        return [TextContent(
             type="text",
             text=f"Ответ от 1С.ai:\n\n{clean_answer}\n\nСессия: {conversation_id}"
         )]
     
-    async def _handle_explain_syntax(self, arguments: dict) -> list[types.TextContent]:
+    async def _handle_explain_syntax(self, arguments: dict) -> list[TextContent]:
         """Обработка инструмента explain_1c_syntax."""
         syntax_element = arguments.get("syntax_element", "")
         context = arguments.get("context", "")
         
         if not syntax_element.strip():
-            return [types.TextContent(
+            return [TextContent(
                 type="text",
                 text="Ошибка: Элемент синтаксиса не может быть пустым"
             )]
         
         # Формируем вопрос для модели
-        question = f"Объясни синтаксис и использование: {syntax_element}"
         if context:
-            question += f" в контексте: {context}"
+            question = self._EXPLAIN_CONTEXT_TMPL.format(syntax_element=syntax_element, context=context)
+        else:
+            question = self._EXPLAIN_TMPL.format(syntax_element=syntax_element)
         
         # Получаем сессию и отправляем вопрос
         conversation_id = await self.api_client.get_or_create_session()
@@ -235,31 +251,25 @@ class OneCMcpServer:
         # Очищаем ответ от проблемных символов
         clean_answer = self._sanitize_text(answer)
         
-        return [types.TextContent(
+        return [TextContent(
             type="text",
             text=f"Объяснение синтаксиса '{syntax_element}':\n\n{clean_answer}"
         )]
     
-    async def _handle_check_code(self, arguments: dict) -> list[types.TextContent]:
+    async def _handle_check_code(self, arguments: dict) -> list[TextContent]:
         """Обработка инструмента check_1c_code."""
         code = arguments.get("code", "")
         check_type = arguments.get("check_type", "syntax")
         
         if not code.strip():
-            return [types.TextContent(
+            return [TextContent(
                 type="text",
                 text="Ошибка: Код для проверки не может быть пустым"
             )]
         
         # Формируем вопрос в зависимости от типа проверки
-        check_descriptions = {
-            "syntax": "синтаксические ошибки",
-            "logic": "логические ошибки и потенциальные проблемы",
-            "performance": "проблемы производительности и оптимизации"
-        }
-        
-        check_desc = check_descriptions.get(check_type, "ошибки")
-        question = f"Проверь этот код 1С на {check_desc} и дай рекомендации:\n\n```1c\n{code}\n```"
+        check_desc = self._CHECK_DESC.get(check_type, "ошибки")
+        question = self._CHECK_TMPL.format(desc=check_desc, code=code)
         
         # Получаем сессию и отправляем вопрос
         conversation_id = await self.api_client.get_or_create_session()
@@ -268,17 +278,32 @@ class OneCMcpServer:
         # Очищаем ответ от проблемных символов
         clean_answer = self._sanitize_text(answer)
         
-        return [types.TextContent(
+        return [TextContent(
             type="text",
             text=f"Проверка кода на {check_desc}:\n\n{clean_answer}"
         )]
     
 
     
+    def _start_warmup(self):
+        """Запустить фоновый прогрев соединения, если конфигурация доступна."""
+        try:
+            if self.config is None:
+                self.config = get_config()
+            if self.api_client is None:
+                self.api_client = OneCApiClient(self.config)
+        except Exception:
+            # Ошибка конфигурации будет показана при первом вызове инструмента
+            return
+        
+        self._warmup_task = asyncio.create_task(self.api_client.warmup())
+    
     async def run(self, transport: str = "stdio"):
         """Запуск MCP сервера."""
         try:
-            # Не проверяем конфигурацию при запуске - будем делать это при первом вызове инструмента
+            # Не проверяем конфигурацию при запуске - будем делать это при первом вызове инструмента,
+            # но если она уже доступна, прогреваем соединение с API в фоне
+            self._start_warmup()
             
             # Запускаем сервер
             if transport == "stdio":
@@ -300,9 +325,12 @@ class OneCMcpServer:
                 raise ValueError(f"Неподдерживаемый транспорт: {transport}")
                 
         except Exception as e:
-            logger.error(f"Ошибка при запуске сервера: {str(e)}")
+            logger.error("Ошибка при запуске сервера: %s", e)
             raise
         finally:
+            if self._warmup_task and not self._warmup_task.done():
+                self._warmup_task.cancel()
+            
             # Закрываем API клиент
             if self.api_client:
                 await self.api_client.close()
@@ -314,7 +342,7 @@ async def main():
         server = OneCMcpServer()
         await server.run()
     except Exception as e:
-        logger.error(f"Критическая ошибка: {str(e)}")
+        logger.error("Критическая ошибка: %s", e)
         raise
 
 
@@ -1,9 +1,14 @@
 """Pydantic модели для API 1С.ai и MCP."""
 
-from typing import Optional, Any, Dict, List
+import time
+from collections import deque
+from typing import Optional, Any, Deque, Dict, List, Tuple
 from pydantic import BaseModel, Field
 from datetime import datetime
 
+# Сколько последних обращений к сессии учитывать при вытеснении (LRU-K)
+SESSION_HISTORY_K = 2
+
 
 class ConversationRequest(BaseModel):
     """Запрос на создание новой дискуссии."""
@@ -42,13 +47,28 @@ class ConversationSession(BaseModel):
     """Сессия дискуссии."""
     conversation_id: str
     created_at: datetime = Field(default_factory=datetime.now)
-    last_used: datetime = Field(default_factory=datetime.now)
+    # Время последнего использования по time.monotonic() - для расчета TTL
+    last_used: float = Field(default_factory=time.monotonic)
     messages_count: int = 0
+    access_times: Deque[float] = Field(
+        default_factory=lambda: deque(maxlen=SESSION_HISTORY_K)
+    )
     
     def update_usage(self):
         """Обновить время последнего использования."""
-        self.last_used = datetime.now()
+        self.last_used = time.monotonic()
+        self.access_times.append(self.last_used)
         self.messages_count += 1
+    
+    def eviction_key(self) -> Tuple[bool, float]:
+        """Ключ вытеснения LRU-K: меньший ключ вытесняется раньше.
+        
+        Сессии с историей короче K (разовые запросы) уходят первыми в порядке LRU,
+        остальные - по времени K-го с конца обращения.
+        """
+        if len(self.access_times) >= SESSION_HISTORY_K:
+            return True, self.access_times[0]
+        return False, self.last_used
 
 
 class ApiError(Exception):
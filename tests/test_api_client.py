@@ -0,0 +1,175 @@
+"""Тесты клиента API 1С.ai без обращения к сети."""
+
+import asyncio
+import time
+
+import httpx
+
+from MCP_1copilot.api_client import OneCApiClient
+from MCP_1copilot.config import Config
+from MCP_1copilot.models import ApiError, ConversationSession
+
+
+class FakeStreamResponse:
+    """Ответ с заранее заданными чанками вместо SSE потока."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def aiter_bytes(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def collect_lines(chunks):
+    """Собрать строки, которые выдает _iter_sse_lines для набора чанков."""
+    async def collect():
+        response = FakeStreamResponse(chunks)
+        return [bytes(line) async for line in OneCApiClient._iter_sse_lines(response)]
+
+    return asyncio.run(collect())
+
+
+def test_iter_sse_lines_joins_split_frames():
+    assert collect_lines([b'data: {"a"', b': 1}\n', b'\n']) == [b'data: {"a": 1}', b'']
+
+
+def test_iter_sse_lines_handles_crlf_and_bare_cr():
+    assert collect_lines([b"data: 1\r\ndata: 2\rdata: 3\n"]) == [
+        b"data: 1", b"data: 2", b"data: 3"
+    ]
+
+
+def test_iter_sse_lines_crlf_split_between_chunks():
+    assert collect_lines([b"data: 1\r", b"\ndata: 2\n"]) == [b"data: 1", b"data: 2"]
+
+
+def test_iter_sse_lines_keepalive_comment():
+    assert collect_lines([b": ping\n\ndata: 1\n"]) == [b": ping", b"", b"data: 1"]
+
+
+def test_iter_sse_lines_last_line_without_newline():
+    assert collect_lines([b"data: 1\ndata: 2"]) == [b"data: 1", b"data: 2"]
+    assert collect_lines([b"data: 1\r"]) == [b"data: 1"]
+
+
+def test_parse_sse_response_replaces_invalid_utf8():
+    chunks = [
+        b": keepalive\r\n",
+        b'data: {"role": "assistant", "content": {"text": "\xd0\x9e\xff"}, ',
+        b'"finished": true}\r\n',
+    ]
+
+    async def parse():
+        async with OneCApiClient(Config(onec_ai_token="test-token")) as client:
+            return await client._parse_sse_response(FakeStreamResponse(chunks))
+
+    text = asyncio.run(parse())
+
+    assert text == "О�"
+
+
+def test_shared_http_client_closed_with_last_owner():
+    async def run():
+        config = Config(onec_ai_token="shared-token")
+        first = OneCApiClient(config)
+        second = OneCApiClient(config)
+        assert first.client is second.client
+
+        await first.close()
+        await first.close()  # Повторное закрытие не уменьшает счетчик еще раз
+        assert not second.client.is_closed
+
+        await second.close()
+        assert second.client.is_closed
+
+        third = OneCApiClient(config)
+        assert third.client is not second.client
+        await third.close()
+
+    asyncio.run(run())
+
+
+def test_warmup_swallows_non_network_errors():
+    async def failing_head(*args, **kwargs):
+        raise httpx.InvalidURL("bad url")
+
+    async def run():
+        async with OneCApiClient(Config(onec_ai_token="warmup-token")) as client:
+            client.client.head = failing_head
+            await client.warmup()
+
+    asyncio.run(run())
+
+
+def test_send_messages_orders_per_conversation_and_keeps_errors():
+    calls = []
+    active = set()
+    overlapped = []
+
+    async def fake_send_message(conversation_id, message):
+        assert conversation_id not in active, "сообщения одной дискуссии не должны пересекаться"
+        active.add(conversation_id)
+        overlapped.append(len(active) > 1)
+        calls.append((conversation_id, message))
+        await asyncio.sleep(0.01)
+        active.discard(conversation_id)
+        if message == "fail":
+            raise ApiError("boom")
+        return f"{conversation_id}:{message}"
+
+    async def run():
+        async with OneCApiClient(Config(onec_ai_token="batch-token")) as client:
+            client.send_message = fake_send_message
+            return await client.send_messages(
+                [("a", "1"), ("b", "fail"), ("a", "2"), ("b", "3")]
+            )
+
+    results = asyncio.run(run())
+
+    assert results[0] == "a:1"
+    assert isinstance(results[1], ApiError)
+    assert results[2:] == ["a:2", "b:3"]
+    assert [m for c, m in calls if c == "a"] == ["1", "2"]
+    assert [m for c, m in calls if c == "b"] == ["fail", "3"]
+    assert any(overlapped)
+
+
+def make_session(conversation_id, *access_times):
+    session = ConversationSession(conversation_id=conversation_id)
+    for access_time in access_times:
+        session.access_times.append(access_time)
+    session.last_used = access_times[-1]
+    return session
+
+
+def test_lru_k_eviction_order():
+    now = time.monotonic()
+    config = Config(onec_ai_token="lru-token", max_active_sessions=2)
+
+    async def run():
+        async with OneCApiClient(config) as client:
+            # Порядок в OrderedDict соответствует last_used, как после send_message()
+            for session in (
+                make_session("once_a", now - 9),
+                make_session("once_b", now - 8),
+                make_session("regular_old", now - 10, now - 6),
+                make_session("regular_new", now - 7, now - 5),
+                make_session("recent_once", now - 4),
+            ):
+                client.sessions[session.conversation_id] = session
+
+            evicted = []
+            while len(client.sessions) > 1:
+                before = set(client.sessions)
+                assert await client.get_or_create_session() == "recent_once"
+                evicted.extend(before - set(client.sessions))
+            return evicted, list(client.sessions)
+
+    evicted, remaining = asyncio.run(run())
+
+    # Сессии с одним обращением уходят раньше сессий с K обращениями, даже если те старше;
+    # внутри группы - по самому старому учитываемому обращению
+    assert evicted == ["once_a", "once_b", "regular_old", "regular_new"]
+    # Самая свежая сессия не вытесняется, даже если у нее одно обращение
+    assert remaining == ["recent_once"]